@@ -6,6 +6,8 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from src.routes import auth, contacts, users
 from src.config.config import settings
+from src.config.log import start_logging, stop_logging
+from src.services.email import smtp_pool, start_mail_workers, stop_mail_workers
 
 app = FastAPI()
 
@@ -22,8 +24,25 @@ async def startup():
     :return: A future, so we need to await it
     :doc-author: Trelent
     """
+    start_logging()
     r = await redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0, encoding='utf-8', decode_responses=True)
     await FastAPILimiter.init(r)
+    await start_mail_workers()
+
+
+@app.on_event('shutdown')
+async def shutdown():
+    """
+    The shutdown function is called when the application stops.
+    It sends the emails still waiting in the queue, closes the SMTP sessions kept open for sending them
+    and flushes the log queue.
+    
+    :return: A future, so we need to await it
+    :doc-author: Trelent
+    """
+    await stop_mail_workers()
+    await smtp_pool.close()
+    stop_logging()
 
 origins = ['http://localhost:3000']
 app.add_middleware(
@@ -47,4 +66,5 @@ def read_root():
 
 
 if __name__ == '__main__':
+    # uvicorn's default loop='auto' runs the app on uvloop wherever it is installed
     uvicorn.run(app, host='localhost', port=8000)
\ No newline at end of file
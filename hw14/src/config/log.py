@@ -0,0 +1,42 @@
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+_listener: QueueListener | None = None
+_queue_handler: QueueHandler | None = None
+
+
+def start_logging() -> None:
+    """
+    The start_logging function routes the application's log records through a queue.
+        Loggers only put records on the queue, a background thread of the QueueListener writes them to stderr,
+        so a burst of errors does not block the event loop on the stream.
+
+    :return: None
+    :doc-author: Trelent
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+    records = queue.SimpleQueue()
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    _queue_handler = QueueHandler(records)
+    _listener = QueueListener(records, stream, respect_handler_level=True)
+    logging.getLogger().addHandler(_queue_handler)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """
+    The stop_logging function writes out the records still in the queue and stops the listener thread.
+
+    :return: None
+    :doc-author: Trelent
+    """
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    logging.getLogger().removeHandler(_queue_handler)
+    _listener.stop()
+    _listener = _queue_handler = None
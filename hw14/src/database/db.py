@@ -1,21 +1,33 @@
+from asyncio import current_task
+
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import SQLAlchemyError
-from fastapi import HTTPException, status
+from sqlalchemy.orm import scoped_session, sessionmaker
 
 from src.config.config import settings
 
 
 SQLALCHEMY_DATABASE_URL = settings.sqlalchemy_database_url
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# pool_size/max_overflow bound the connections held per worker process, pool_timeout is how long
+# a request waits for a free connection, pool_recycle replaces connections older than that many
+# seconds and pool_pre_ping discards connections the server has dropped before they are handed out.
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=True,
+)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# One session per request: FastAPI serves each request in its own asyncio task
+SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine), scopefunc=current_task)
 
 
-def get_db():
+async def get_db():
     """
-    The get_db function is a context manager that will automatically close the database session when it goes out of scope.
-    It also handles any exceptions that occur within the with block, rolling back changes if necessary.
+    The get_db function is a dependency that yields the session scoped to the current request.
+    When the request is finished the session is removed from the registry, which closes it and rolls back
+    anything left uncommitted. Errors are not caught here, so they reach FastAPI's exception handlers.
     
     :return: A database session
     :doc-author: Trelent
@@ -23,8 +35,5 @@ def get_db():
     db = SessionLocal()
     try:
         yield db
-    except SQLAlchemyError as err:
-        db.rollback()
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
     finally:
-        db.close()
\ No newline at end of file
+        SessionLocal.remove()
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, ForeignKey, func
+from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, ForeignKey, Index, func
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -18,6 +18,11 @@ class Contact(Base):
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     user_id = Column(ForeignKey('users.id', ondelete='CASCADE'), default=None)
     user = relationship('User', backref='contacts')
+    __table_args__ = (
+        Index('ix_contacts_user_id_first_name', 'user_id', 'first_name'),
+        Index('ix_contacts_user_id_last_name', 'user_id', 'last_name'),
+        Index('ix_contacts_user_id_date_of_birth', 'user_id', 'date_of_birth'),
+    )
 
 
 class User(Base):
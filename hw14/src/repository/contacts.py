@@ -1,16 +1,42 @@
-from datetime import date
+from datetime import date, timedelta
+from functools import lru_cache
 
-from sqlalchemy import and_
+from sqlalchemy import Select, bindparam, select, insert, update, delete, or_, func
 from sqlalchemy.orm import Session
 
 from src.database.models import Contact, User
 from src.schemas import ContactModel
 
 
-async def get_contacts(skip: int, limit: int, first_name: str, last_name: str, email: str, user: User, db: Session):
+@lru_cache(maxsize=None)
+def _contacts_query(filters: tuple[str, ...], keyset: bool) -> Select:
+    """
+    The _contacts_query function builds the statement used by get_contacts for one combination of search filters.
+        All values, including the user id and pagination, are bind parameters, so the statement is built once per
+        combination and its compiled form is reused by SQLAlchemy on every call.
+
+    :param filters: tuple[str, ...]: Names of the Contact columns that are searched for
+    :param keyset: bool: Page by the after_id parameter instead of skip
+    :return: A select statement with the bind parameters user_id, limit, skip or after_id and one per filter
+    :doc-author: Trelent
+    """
+    stmt = select(Contact).where(Contact.user_id == bindparam('user_id'))
+    if filters:
+        stmt = stmt.where(or_(*(getattr(Contact, name) == bindparam(name) for name in filters)))
+    if keyset:
+        stmt = stmt.where(Contact.id > bindparam('after_id'))
+    else:
+        stmt = stmt.offset(bindparam('skip'))
+    return stmt.order_by(Contact.id).limit(bindparam('limit'))
+
+
+async def get_contacts(skip: int, limit: int, first_name: str, last_name: str, email: str, user: User, db: Session,
+                       after_id: int | None = None):
     """
     The get_contacts function returns a list of contacts that match the search criteria.
         If no search criteria is provided, it will return all contacts for the user.
+        Contacts are ordered by id; when after_id is given it is used instead of skip, so the database seeks
+        straight to the next page instead of reading and discarding the skipped rows.
     
     :param skip: int: Skip the first n records
     :param limit: int: Limit the number of contacts returned
@@ -19,27 +45,14 @@ async def get_contacts(skip: int, limit: int, first_name: str, last_name: str, e
     :param email: str: Filter the contacts by email
     :param user: User: Get the user_id of the logged in user
     :param db: Session: Access the database
+    :param after_id: int | None: Return only contacts with a greater id (id of the last contact of the previous page)
     :return: A list of contacts that match the query parameters
     :doc-author: Trelent
     """
-    first_name_query = db.query(Contact).filter(and_(Contact.first_name == first_name, Contact.user_id == user.id))
-    last_name_query = db.query(Contact).filter(and_(Contact.last_name == last_name, Contact.user_id == user.id))
-    email_query = db.query(Contact).filter(and_(Contact.email == email, Contact.user_id == user.id))
-    if first_name and last_name and email:
-        return first_name_query.union(last_name_query).union(email_query).all()
-    if first_name and last_name:
-        return first_name_query.union(last_name_query).all()
-    if first_name and email:
-        return first_name_query.union(email_query).all()
-    if last_name and email:
-        return last_name_query.union(email_query).all()
-    if first_name:
-        return first_name_query.all()
-    if last_name:
-        return last_name_query.all()
-    if email:
-        return email_query.all()
-    return db.query(Contact).filter(Contact.user_id == user.id).offset(skip).limit(limit).all()
+    search = {name: value for name, value in (('first_name', first_name), ('last_name', last_name), ('email', email)) if value}
+    stmt = _contacts_query(tuple(search), after_id is not None)
+    page = {'skip': skip} if after_id is None else {'after_id': after_id}
+    return db.execute(stmt, {'user_id': user.id, 'limit': limit, **page, **search}).scalars().all()
 
 
 async def get_contacts_birthdays(skip: int, limit: int, user: User, db: Session):
@@ -57,17 +70,17 @@ async def get_contacts_birthdays(skip: int, limit: int, user: User, db: Session)
     :return: A list of contacts with birthdays in the next 7 days
     :doc-author: Trelent
     """
-    contacts_with_birthdays = []
     today = date.today()
-    current_year = today.year
-    contacts = db.query(Contact).filter(Contact.user_id == user.id).offset(skip).limit(limit).all()
-    for contact in contacts:
-        td = contact.date_of_birth.replace(year=current_year) - today
-        if 0 <= td.days <= 7:
-            contacts_with_birthdays.append(contact)
-        else:
-            continue
-    return contacts_with_birthdays
+    start = today.strftime('%m-%d')
+    end = (today + timedelta(days=7)).strftime('%m-%d')
+    birthday = func.to_char(Contact.date_of_birth, 'MM-DD')
+    if start <= end:
+        in_next_week = birthday.between(start, end)
+    else:
+        # The window wraps over the new year (e.g. 12-28 .. 01-04)
+        in_next_week = or_(birthday >= start, birthday <= end)
+    stmt = select(Contact).where(Contact.user_id == user.id, in_next_week).order_by(Contact.id).offset(skip).limit(limit)
+    return db.execute(stmt).scalars().all()
 
 
 async def get_contact_by_id(contact_id: int, user: User, db: Session):
@@ -84,7 +97,7 @@ async def get_contact_by_id(contact_id: int, user: User, db: Session):
     :return: A contact object
     :doc-author: Trelent
     """
-    return db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
+    return db.execute(select(Contact).where(Contact.id == contact_id, Contact.user_id == user.id)).scalar_one_or_none()
 
 
 async def create_contact(body: ContactModel, user: User, db: Session):
@@ -98,10 +111,9 @@ async def create_contact(body: ContactModel, user: User, db: Session):
     :return: A contact object
     :doc-author: Trelent
     """
-    contact = Contact(**body.dict(), user_id=user.id)
-    db.add(contact)
+    contact = db.execute(insert(Contact).values(**body.dict(), user_id=user.id).returning(Contact)).scalar_one()
+    db.expunge(contact)
     db.commit()
-    db.refresh(contact)
     return contact
 
 
@@ -121,13 +133,16 @@ async def update_contact(contact_id: int, body: ContactModel, user: User, db: Se
     :return: The contact object
     :doc-author: Trelent
     """
-    contact = db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
+    stmt = (
+        update(Contact)
+        .where(Contact.id == contact_id, Contact.user_id == user.id)
+        .values(**body.dict())
+        .returning(Contact)
+    )
+    contact = db.execute(stmt).scalar_one_or_none()
     if contact:
-        contact.first_name = body.first_name
-        contact.last_name = body.last_name
-        contact.email = body.email
-        contact.phone = body.phone
-        contact.date_of_birth = body.date_of_birth
+        # Detach the returned row so that commit() does not expire it and trigger a reload
+        db.expunge(contact)
         db.commit()
     return contact
 
@@ -148,8 +163,9 @@ async def remove_contact(contact_id: int, user: User, db: Session):
     :return: A contact object
     :doc-author: Trelent
     """
-    contact = db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
+    stmt = delete(Contact).where(Contact.id == contact_id, Contact.user_id == user.id).returning(Contact)
+    contact = db.execute(stmt).scalar_one_or_none()
     if contact:
-        db.delete(contact)
+        db.expunge(contact)
         db.commit()
-    return contact
\ No newline at end of file
+    return contact
@@ -1,4 +1,5 @@
 from libgravatar import Gravatar
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
 
 from src.database.models import User
@@ -14,7 +15,7 @@ async def get_user_by_email(email: str, db: Session):
     :return: The first user that matches the email address
     :doc-author: Trelent
     """
-    return db.query(User).filter(User.email == email).first()
+    return db.execute(select(User).where(User.email == email)).scalar_one_or_none()
 
 
 async def create_user(body: UserModel, db: Session):
@@ -65,8 +66,7 @@ async def confirmed_email(email: str, db: Session) -> None:
     :return: None
     :doc-author: Trelent
     """
-    user = await get_user_by_email(email, db)
-    user.confirmed = True
+    db.execute(update(User).where(User.email == email).values(confirmed=True))
     db.commit()
 
 
@@ -80,7 +80,8 @@ async def update_avatar(email, url: str, db: Session) -> User:
     :return: A user object
     :doc-author: Trelent
     """
-    user = await get_user_by_email(email, db)
-    user.avatar = url
+    user = db.execute(update(User).where(User.email == email).values(avatar=url).returning(User)).scalar_one()
+    # Detach the returned row so that commit() does not expire it and trigger a reload
+    db.expunge(user)
     db.commit()
-    return user
\ No newline at end of file
+    return user
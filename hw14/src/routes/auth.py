@@ -53,7 +53,7 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid email')
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Email not confirmed')
-    if not auth_service.verify_password(body.password, user.password):
+    if not await auth_service.verify_password(body.password, user.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid password')
     # Generate JWT
     access_token = await auth_service.create_access_token(data={'sub': user.email})
@@ -105,6 +105,7 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
     if user.confirmed:
         return {'message': 'Your email is already confirmed'}
     await repository_users.confirmed_email(email, db)
+    await auth_service.clear_user_cache(email)
     return {'message': 'Email confirmed'}
 
 
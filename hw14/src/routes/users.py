@@ -4,21 +4,20 @@ import cloudinary
 import cloudinary.uploader
 
 from src.database.db import get_db
-from src.database.models import User
 from src.repository import users as repository_users
 from src.services.auth import auth_service
 from src.config.config import settings
-from src.schemas import UserDb
+from src.schemas import UserDb, AuthUser
 
 router = APIRouter(prefix='/users', tags=['users'])
 
 
 @router.get('/me/', response_model=UserDb)
-async def read_users_me(current_user: User = Depends(auth_service.get_current_user)):
+async def read_users_me(current_user: AuthUser = Depends(auth_service.get_current_user)):
     """
     The read_users_me function returns the current user's information.
     
-    :param current_user: User: Get the current user
+    :param current_user: AuthUser: Get the current user
     :return: The current user object
     :doc-author: Trelent
     """
@@ -26,12 +25,12 @@ async def read_users_me(current_user: User = Depends(auth_service.get_current_us
 
 
 @router.patch('/avatar', response_model=UserDb)
-async def update_avatar_user(file: UploadFile = File(), current_user: User = Depends(auth_service.get_current_user), db: Session = Depends(get_db)):
+async def update_avatar_user(file: UploadFile = File(), current_user: AuthUser = Depends(auth_service.get_current_user), db: Session = Depends(get_db)):
     """
     The update_avatar_user function updates the avatar of a user.
     
     :param file: UploadFile: Get the file from the request
-    :param current_user: User: Get the current user from the database
+    :param current_user: AuthUser: Get the current user from the database
     :param db: Session: Get the database session
     :return: The user object
     :doc-author: Trelent
@@ -46,4 +45,5 @@ async def update_avatar_user(file: UploadFile = File(), current_user: User = Dep
     r = cloudinary.uploader.upload(file.file, public_id=f'ContactsApp/{current_user.username}', overwrite=True)
     src_url = cloudinary.CloudinaryImage(f'ContactsApp/{current_user.username}').build_url(width=250, height=250, crop='fill', version=r.get('version'))
     user = await repository_users.update_avatar(current_user.email, src_url, db)
+    await auth_service.clear_user_cache(user.email)
     return user
\ No newline at end of file
@@ -1,4 +1,6 @@
 from datetime import datetime, date
+from typing import Optional
+
 from pydantic import BaseModel, EmailStr, Field
 
 
@@ -36,6 +38,18 @@ class UserDb(BaseModel):
         orm_mode = True
 
 
+class AuthUser(BaseModel):
+    id: int
+    username: str
+    email: str
+    created_at: datetime
+    avatar: Optional[str]
+    confirmed: bool
+
+    class Config:
+        orm_mode = True
+
+
 class UserResponse(BaseModel):
     user: UserDb
     detail: str = 'User successfully created'
@@ -1,31 +1,40 @@
-import pickle
-import redis
+import asyncio
+import time
+import redis.asyncio as redis
 from typing import Optional
 
-from jose import JWTError, jwt
+import jwt
+import orjson
+from cachetools import TLRUCache
+from jwt import InvalidTokenError, api_jws
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
-from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 
 from src.database.db import get_db
 from src.repository import users as repository_users
 from src.config.config import settings
+from src.schemas import AuthUser
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+    pwd_context = CryptContext(schemes=['bcrypt'], bcrypt__rounds=12, deprecated='auto')
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl='/api/auth/login')
     r = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
+    # access token -> (email, exp); an entry lives for at most 60 seconds and never past the token's own expiry
+    token_cache = TLRUCache(maxsize=2048, ttu=lambda _token, value, now: min(now + 60, value[1]), timer=time.time)
+    # email -> future of the cache-miss lookup already in progress, so concurrent misses share one DB query
+    _inflight: dict[str, asyncio.Future] = {}
 
-    def verify_password(self, plain_password, hashed_password):
+    async def verify_password(self, plain_password, hashed_password):
         """
         The verify_password function takes a plain-text password and the hashed version of that password,
             and returns True if they match, False otherwise. This is used to verify that the user's login
             credentials are correct.
+            bcrypt is deliberately slow, so the check runs in a worker thread to keep the event loop free.
         
         :param self: Represent the instance of the class
         :param plain_password: Check the password that is entered by the user
@@ -33,7 +42,7 @@ class Auth:
         :return: A boolean value
         :doc-author: Trelent
         """
-        return self.pwd_context.verify(plain_password, hashed_password)
+        return await asyncio.to_thread(self.pwd_context.verify, plain_password, hashed_password)
 
     def get_password_hash(self, password: str):
         """
@@ -47,6 +56,20 @@ class Auth:
         """
         return self.pwd_context.hash(password)
 
+    def _encode(self, payload: dict) -> str:
+        """
+        The _encode function signs a JWT payload with the SECRET_KEY and ALGORITHM defined in the class.
+            The payload is serialized with orjson and signed directly, without going through the standard json module.
+            The JSON is equivalent to what jwt.encode produces but not always the same bytes: orjson writes non-ASCII
+            characters as UTF-8 where json.dumps escapes them, so such tokens differ while decoding to the same claims.
+
+        :param self: Represent the instance of the class
+        :param payload: dict: The claims of the token, with iat and exp as epoch seconds
+        :return: The encoded token
+        :doc-author: Trelent
+        """
+        return api_jws.encode(orjson.dumps(payload), self.SECRET_KEY, algorithm=self.ALGORITHM)
+
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
         """
         The create_access_token function creates a new access token for the user.
@@ -59,13 +82,10 @@ class Auth:
         :return: A string that is the encoded access token
         :doc-author: Trelent
         """
-        to_encode = data.copy()
-        if expires_delta:
-            expire = datetime.utcnow() + timedelta(seconds=expires_delta)
-        else:
-            expire = datetime.utcnow() + timedelta(minutes=15)
-        to_encode.update({'iat': datetime.utcnow(), 'exp': expire, 'scope': 'access_token'})
-        encoded_access_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        now = int(time.time())
+        expire = now + (int(expires_delta) if expires_delta else 15 * 60)
+        to_encode = {**data, 'iat': now, 'exp': expire, 'scope': 'access_token'}
+        encoded_access_token = self._encode(to_encode)
         return encoded_access_token
 
     async def create_refresh_token(self, data: dict, expires_delta: Optional[float] = None):
@@ -81,13 +101,10 @@ class Auth:
         :return: A refresh token that is encoded with the user's id, email and username
         :doc-author: Trelent
         """
-        to_encode = data.copy()
-        if expires_delta:
-            expire = datetime.utcnow() + timedelta(seconds=expires_delta)
-        else:
-            expire = datetime.utcnow() + timedelta(days=7)
-        to_encode.update({'iat': datetime.utcnow(), 'exp': expire, 'scope': 'refresh_token'})
-        encoded_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        now = int(time.time())
+        expire = now + (int(expires_delta) if expires_delta else 7 * 24 * 60 * 60)
+        to_encode = {**data, 'iat': now, 'exp': expire, 'scope': 'refresh_token'}
+        encoded_refresh_token = self._encode(to_encode)
         return encoded_refresh_token
 
     async def decode_refresh_token(self, refresh_token: str):
@@ -108,7 +125,7 @@ class Auth:
                 email = payload['sub']
                 return email
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
-        except JWTError:
+        except InvalidTokenError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
 
     async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
@@ -128,44 +145,109 @@ class Auth:
             headers={'WWW-Authenticate': 'Bearer'},
         )
 
-        try:
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'access_token':
-                email = payload['sub']
-                if email is None:
+        cached = self.token_cache.get(token)
+        if cached is not None:
+            email = cached[0]
+        else:
+            try:
+                payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+                if payload['scope'] == 'access_token':
+                    email = payload['sub']
+                    if email is None:
+                        raise credentials_exception
+                else:
                     raise credentials_exception
-            else:
+            except InvalidTokenError as e:
                 raise credentials_exception
-        except JWTError as e:
-            raise credentials_exception
+            self.token_cache[token] = (email, payload['exp'])
 
-        user = self.r.get(f'user:{email}')
+        # The JSON entries live under their own prefix, entries pickled by older versions under user: are never read
+        user = await self.r.get(f'auth_user:{email}')
+        if user is not None:
+            return AuthUser.parse_raw(user)
+        while True:
+            future = self._inflight.get(email)
+            if future is None:
+                user = await self._load_user(email, db)
+                break
+            try:
+                # Shielded, so cancelling this request does not cancel the lookup the other requests wait for
+                user = await asyncio.shield(future)
+                break
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The request doing the lookup was cancelled; the first waiter to get here starts a new one
         if user is None:
+            raise credentials_exception
+        return user
+
+    async def _load_user(self, email: str, db: Session) -> AuthUser | None:
+        """
+        The _load_user function fetches the user from the database on a cache miss and stores it in Redis.
+            Requests that miss the cache for the same email while the lookup is running await the same future
+            instead of querying the database again. If this lookup is cancelled the future is cancelled too,
+            and one of the waiting requests starts the lookup again.
+
+        :param self: Represent the instance of the class
+        :param email: str: Email of the user to load
+        :param db: Session: Get the database session
+        :return: The cached user fields or None if there is no such user
+        :doc-author: Trelent
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[email] = future
+        try:
             user = await repository_users.get_user_by_email(email, db)
-            if user is None:
-                raise credentials_exception
-            self.r.set(f'user:{email}', pickle.dumps(user))
-            self.r.expire(f'user:{email}', 900)
+            if user is not None:
+                user = AuthUser.from_orm(user)
+                await self.r.set(f'auth_user:{email}', user.json(), ex=900)
+        except asyncio.CancelledError:
+            # Wake the waiting requests, they retry the lookup themselves
+            future.cancel()
+            raise
+        except Exception as err:
+            future.set_exception(err)
+            # Mark the exception as retrieved: it is re-raised here even if nobody else awaits the future
+            future.exception()
+            raise
         else:
-            user = pickle.loads(user)
+            future.set_result(user)
+        finally:
+            if self._inflight.get(email) is future:
+                del self._inflight[email]
         return user
     
-    def create_email_token(self, data: dict):
+    async def clear_user_cache(self, email: str) -> None:
+        """
+        The clear_user_cache function removes the cached copy of a user from Redis.
+            It must be called after changing any of the fields cached by get_current_user,
+            otherwise the old values are served until the cache entry expires.
+
+        :param self: Represent the instance of the class
+        :param email: str: Email of the user whose cache entry is removed
+        :return: None
+        :doc-author: Trelent
+        """
+        await self.r.delete(f'auth_user:{email}')
+
+    def create_email_token(self, data: dict, iat: Optional[int] = None):
         """
         The create_email_token function takes a dictionary of data and returns a token.
             The token is encoded with the SECRET_KEY and ALGORITHM defined in the class.
             The dictionary passed to this function should contain at least an email key, 
             but can also include other keys that will be included in the payload of the JWT.
+            Passing iat makes the token reproducible: the same data and iat always give the same token.
         
         :param self: Represent the instance of the class
         :param data: dict: Pass in the data that will be encoded into a token
+        :param iat: Optional[int]: Issue time in epoch seconds, defaults to now; the token expires 7 days later
         :return: A token that is encoded with the user's email, a timestamp, and an expiration date
         :doc-author: Trelent
         """
-        to_encode = data.copy()
-        expire = datetime.utcnow() + timedelta(days=7)
-        to_encode.update({'iat': datetime.utcnow(), 'exp': expire})
-        token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        now = int(time.time()) if iat is None else iat
+        to_encode = {**data, 'iat': now, 'exp': now + 7 * 24 * 60 * 60}
+        token = self._encode(to_encode)
         return token
     
     
@@ -183,7 +265,7 @@ class Auth:
             payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
             email = payload['sub']
             return email
-        except JWTError as e:
+        except InvalidTokenError as e:
             print(e)
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail='Invalid token for email verification')
 
@@ -1,25 +1,249 @@
+import asyncio
+import logging
+import re
+from datetime import date, datetime, time, timezone
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formatdate, make_msgid
+from functools import lru_cache
 from pathlib import Path
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
+import aiosmtplib
+from cachetools import LRUCache
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from markupsafe import escape
+from fastapi_mail import ConnectionConfig
 from pydantic import EmailStr
 
 from src.services.auth import auth_service
+from src.services.smtp_pool import SMTPPool
 from src.config.config import settings
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.mail_username,
-    MAIL_PASSWORD=settings.mail_password,
-    MAIL_FROM=EmailStr(settings.mail_from),
-    MAIL_PORT=settings.mail_port,
-    MAIL_SERVER=settings.mail_server,
-    MAIL_FROM_NAME='Contacts App',
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
+logger = logging.getLogger(__name__)
+
+_TEMPLATE_DIR = Path(__file__).parent / 'templates'
+
+
+@lru_cache(maxsize=1)
+def _get_conf() -> ConnectionConfig:
+    """
+    The _get_conf function returns the mail settings, validating them the first time it is called.
+        Building the config on first use keeps its validation out of the import of this module.
+
+    :return: The mail connection settings
+    :doc-author: Trelent
+    """
+    return ConnectionConfig(
+        MAIL_USERNAME=settings.mail_username,
+        MAIL_PASSWORD=settings.mail_password,
+        MAIL_FROM=settings.mail_from,
+        MAIL_PORT=settings.mail_port,
+        MAIL_SERVER=settings.mail_server,
+        MAIL_FROM_NAME='Contacts App',
+        MAIL_STARTTLS=False,
+        MAIL_SSL_TLS=True,
+        USE_CREDENTIALS=True,
+        VALIDATE_CERTS=True,
+        TEMPLATE_FOLDER=_TEMPLATE_DIR,
+    )
+
+
+# The template never changes while the app runs, so it is loaded and compiled once here instead of on every send
+_env = Environment(
+    loader=FileSystemLoader(_TEMPLATE_DIR),
+    autoescape=select_autoescape(),
+    auto_reload=False,
+    enable_async=True,
 )
+_template = _env.get_template('email_template.html')
+# host -> the rendered template split around the username and token placeholders
+_frames = LRUCache(maxsize=16)
+_FIELDS = re.compile('(__USERNAME__|__TOKEN__)')
+
+
+async def _connect() -> aiosmtplib.SMTP:
+    """
+    The _connect function opens a new SMTP session with the mail server and logs in.
+
+    :return: A connected and authenticated SMTP client
+    :doc-author: Trelent
+    """
+    conf = _get_conf()
+    smtp = aiosmtplib.SMTP(
+        hostname=conf.MAIL_SERVER,
+        port=conf.MAIL_PORT,
+        use_tls=conf.MAIL_SSL_TLS,
+        start_tls=conf.MAIL_STARTTLS,
+        validate_certs=conf.VALIDATE_CERTS,
+        timeout=conf.TIMEOUT,
+    )
+    await smtp.connect()
+    if conf.USE_CREDENTIALS:
+        await smtp.login(conf.MAIL_USERNAME, conf.MAIL_PASSWORD)
+    return smtp
+
+
+smtp_pool = SMTPPool(_connect, max_size=5, max_messages=100)
+# Created by start_mail_workers; while it is None, send_email delivers the email itself
+_mail_queue: asyncio.Queue | None = None
+_workers: list[asyncio.Task] = []
+# Number of emails the workers have taken from the queue and are sending right now
+_sending = 0
+
+
+async def _send(message: MIMEMultipart) -> None:
+    """
+    The _send function sends a message over one of the pooled SMTP sessions.
+        If the server has closed the session in the meantime, the message is sent once more over another one.
+
+    :param message: MIMEMultipart: The message to send
+    :return: None
+    :doc-author: Trelent
+    """
+    try:
+        async with smtp_pool.acquire() as smtp:
+            await smtp.send_message(message)
+    except aiosmtplib.SMTPServerDisconnected:
+        async with smtp_pool.acquire() as smtp:
+            await smtp.send_message(message)
+
+
+@lru_cache(maxsize=1024)
+def _token_for(email: str, day: date) -> str:
+    """
+    The _token_for function returns the email confirmation token for an address, signing it at most once a day.
+        The token is issued at midnight UTC of the given day, so it stays valid for six to seven days after it is sent.
+
+    :param email: str: The address being confirmed
+    :param day: date: The current UTC date
+    :return: The email confirmation token
+    :doc-author: Trelent
+    """
+    issued_at = int(datetime.combine(day, time.min, tzinfo=timezone.utc).timestamp())
+    return auth_service.create_email_token({'sub': email}, iat=issued_at)
+
+
+async def _render_confirmation(host: str, username: str, token: str) -> str:
+    """
+    The _render_confirmation function renders the body of the confirmation email.
+        The template is rendered once per host with placeholders for the username and the token;
+        after that only the placeholders are filled in, with the username escaped just as autoescape would.
+
+    :param host: str: Base URL the confirmation link points to; routes pass request.base_url, a starlette URL
+    :param username: str: The username shown in the email
+    :param token: str: The email confirmation token
+    :return: The HTML body of the email
+    :doc-author: Trelent
+    """
+    # starlette's URL is not hashable, the cache is keyed on its string form
+    host = str(host)
+    parts = _frames.get(host)
+    if parts is None:
+        html = await _template.render_async(host=host, username='__USERNAME__', token='__TOKEN__')
+        parts = _frames[host] = _FIELDS.split(html)
+    values = {'__USERNAME__': escape(username), '__TOKEN__': token}
+    # Odd items of the split are the placeholders, the rest is literal text
+    return ''.join(values[part] if i % 2 else part for i, part in enumerate(parts))
+
+
+def _build_message(email: str, subject: str, html: str) -> MIMEMultipart:
+    """
+    The _build_message function wraps a rendered HTML body into a MIME message from the app's sender address.
+
+    :param email: str: Recipient shown in the To header
+    :param subject: str: Subject of the message
+    :param html: str: The rendered HTML body
+    :return: The message ready to be sent
+    :doc-author: Trelent
+    """
+    message = MIMEMultipart('mixed')
+    message['Date'] = formatdate(localtime=True)
+    message['Message-ID'] = make_msgid()
+    message['To'] = email
+    conf = _get_conf()
+    message['From'] = f'{conf.MAIL_FROM_NAME} <{conf.MAIL_FROM}>'
+    message['Subject'] = subject
+    message.attach(MIMEText(html, 'html', 'utf-8'))
+    return message
+
+
+async def _deliver(email: str, username: str, host: str) -> None:
+    """
+    The _deliver function renders the confirmation email for a user and sends it.
+        Failures to reach the mail server are logged and swallowed, the user can ask for the email again.
+
+    :param email: str: The user's email address
+    :param username: str: The username shown in the email
+    :param host: str: Base URL the confirmation link points to
+    :return: None
+    :doc-author: Trelent
+    """
+    try:
+        token_verification = _token_for(email, datetime.now(timezone.utc).date())
+        html = await _render_confirmation(host, username, token_verification)
+        await _send(_build_message(email, 'Confirm your email', html))
+    except (aiosmtplib.SMTPException, OSError) as err:
+        logger.warning('Could not send the confirmation email to %s', email, exc_info=err)
+
+
+async def _mail_worker(queue: asyncio.Queue) -> None:
+    """
+    The _mail_worker function sends the emails put on the queue, one at a time, until it is cancelled.
+
+    :param queue: asyncio.Queue: The queue of (email, username, host) tuples
+    :return: None
+    :doc-author: Trelent
+    """
+    global _sending
+    while True:
+        email, username, host = await queue.get()
+        _sending += 1
+        try:
+            await _deliver(email, username, host)
+        except Exception:
+            logger.exception('Mail worker failed on the confirmation email to %s', email)
+        finally:
+            _sending -= 1
+            queue.task_done()
+
+
+async def start_mail_workers(count: int = 5) -> None:
+    """
+    The start_mail_workers function creates the mail queue and the tasks that empty it.
+        It is called when the application starts up; until then send_email delivers the email itself.
+
+    :param count: int: Number of workers, there is no use in more than the SMTP pool size
+    :return: None
+    :doc-author: Trelent
+    """
+    global _mail_queue
+    _mail_queue = asyncio.Queue(maxsize=1000)
+    _workers.extend(asyncio.create_task(_mail_worker(_mail_queue)) for _ in range(count))
+
+
+async def stop_mail_workers(timeout: float = 30) -> None:
+    """
+    The stop_mail_workers function waits until every queued email has been sent and then stops the workers.
+        It is called when the application shuts down. The wait is limited to timeout seconds, so an unreachable
+        mail server can not hold up the shutdown; emails that are not sent by then are dropped and their number logged.
+
+    :param timeout: float: Seconds to wait for the queue to drain
+    :return: None
+    :doc-author: Trelent
+    """
+    global _mail_queue
+    if _mail_queue is None:
+        return
+    try:
+        await asyncio.wait_for(_mail_queue.join(), timeout)
+    except asyncio.TimeoutError:
+        logger.warning('Mail queue did not drain within %s seconds, dropping %d emails',
+                       timeout, _mail_queue.qsize() + _sending)
+    for worker in _workers:
+        worker.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _mail_queue = None
 
 
 async def send_email(email: EmailStr, username: str, host: str):
@@ -29,23 +253,46 @@ async def send_email(email: EmailStr, username: str, host: str):
             -email: the user's email address, which is used as a subject for the token and also as a recipient of the message
             -username: this is used in both places where we need to display information about who we are sending this message to
             -host: This is needed so that we can create an absolute URL using FastAPI
-    
+        Once the mail workers are running the email is only queued, and the call returns as soon as there is room in the queue.
+
     :param email: EmailStr: Make sure that the email is a valid email address
     :param username: str: Pass the username of the user to be registered
     :param host: str: Pass the host of the website to the template
     :return: A coroutine object
     :doc-author: Trelent
     """
+    if _mail_queue is None:
+        await _deliver(email, username, host)
+    else:
+        await _mail_queue.put((email, username, host))
+
+
+async def send_email_bulk(emails: list[EmailStr], subject: str, template_name: str, template_body: dict,
+                          chunk_size: int = 50) -> int:
+    """
+    The send_email_bulk function sends the same email to many recipients, such as an announcement to all users.
+        The body is rendered once and the recipients are put on the envelope in chunks of chunk_size,
+        so each chunk costs a single SMTP transaction on a session taken from the pool.
+        The recipients do not see each other's addresses. If a chunk fails, the remaining ones are not sent.
+
+    :param emails: list[EmailStr]: Addresses of the recipients
+    :param subject: str: Subject of the email
+    :param template_name: str: Name of the template in the templates folder
+    :param template_body: dict: Values passed to the template
+    :param chunk_size: int: Maximum number of recipients per SMTP transaction
+    :return: The number of recipients the server accepted
+    :doc-author: Trelent
+    """
+    html = await _env.get_template(template_name).render_async(**template_body)
+    message = _build_message('undisclosed-recipients:;', subject, html)
+    accepted = 0
     try:
-        token_verification = auth_service.create_email_token({'sub': email})
-        message = MessageSchema(
-            subject='Confirm your email',
-            recipients=[email],
-            template_body={'host': host, 'username': username, 'token': token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name='email_template.html')
-    except ConnectionErrors as err:
-        print(err)
+        for i in range(0, len(emails), chunk_size):
+            chunk = emails[i:i + chunk_size]
+            # Each chunk is a message of its own, so it counts towards the session's max_messages
+            async with smtp_pool.acquire() as smtp:
+                refused, _ = await smtp.send_message(message, recipients=chunk)
+            accepted += len(chunk) - len(refused)
+    except (aiosmtplib.SMTPException, OSError) as err:
+        logger.warning('Bulk email stopped after %d of %d recipients', accepted, len(emails), exc_info=err)
+    return accepted
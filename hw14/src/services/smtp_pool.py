@@ -0,0 +1,134 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable
+
+import aiosmtplib
+
+
+class SMTPPool:
+    def __init__(
+        self,
+        connect: Callable[[], Awaitable[aiosmtplib.SMTP]],
+        max_size: int = 5,
+        max_messages: int = 100,
+        max_idle: float = 60,
+    ):
+        """
+        The __init__ function sets up an empty pool; sessions are opened lazily, the first time they are needed.
+
+        :param self: Represent the instance of the class
+        :param connect: Callable[[], Awaitable[aiosmtplib.SMTP]]: Coroutine function that opens a logged-in session
+        :param max_size: int: Maximum number of sessions open at the same time
+        :param max_messages: int: Number of messages after which a session is closed and replaced
+        :param max_idle: float: Seconds a session may sit unused before it is considered stale
+        :return: None
+        :doc-author: Trelent
+        """
+        self._connect = connect
+        self.max_messages = max_messages
+        self.max_idle = max_idle
+        self._slots = asyncio.Semaphore(max_size)
+        # Sessions that are not in use and the time they were returned, most recently used last
+        self._idle: list[tuple[aiosmtplib.SMTP, float]] = []
+        self._sent: dict[aiosmtplib.SMTP, int] = {}
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[aiosmtplib.SMTP]:
+        """
+        The acquire function lends a session from the pool for the duration of an async with block.
+            When all max_size sessions are in use, it waits until one is returned.
+            A session is put back after the block unless it has reached max_messages or was left in an unknown state,
+            in which case it is closed.
+
+        :param self: Represent the instance of the class
+        :return: A connected SMTP client
+        :doc-author: Trelent
+        """
+        async with self._slots:
+            smtp = await self._checkout()
+            try:
+                yield smtp
+            except (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused):
+                # The server refused the message and the transaction was reset, the session itself is fine
+                await self._release(smtp)
+                raise
+            except BaseException:
+                self._discard(smtp)
+                raise
+            else:
+                await self._release(smtp)
+
+    async def close(self) -> None:
+        """
+        The close function logs out of every idle session in the pool.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+        idle, self._idle = self._idle, []
+        for smtp, _ in idle:
+            await self._quit(smtp)
+
+    async def _checkout(self) -> aiosmtplib.SMTP:
+        """
+        The _checkout function takes the most recently used idle session, or opens a new one if there is none left.
+            Idle sessions that have been dropped or sat unused longer than max_idle are closed on the way.
+
+        :param self: Represent the instance of the class
+        :return: A connected SMTP client
+        :doc-author: Trelent
+        """
+        while self._idle:
+            smtp, returned_at = self._idle.pop()
+            if smtp.is_connected and time.monotonic() - returned_at < self.max_idle:
+                return smtp
+            self._discard(smtp)
+        smtp = await self._connect()
+        self._sent[smtp] = 0
+        return smtp
+
+    async def _release(self, smtp: aiosmtplib.SMTP) -> None:
+        """
+        The _release function counts the message sent on a session and returns the session to the pool,
+            or logs out of it once it has sent max_messages.
+
+        :param self: Represent the instance of the class
+        :param smtp: aiosmtplib.SMTP: The session being returned
+        :return: None
+        :doc-author: Trelent
+        """
+        self._sent[smtp] += 1
+        if self._sent[smtp] >= self.max_messages:
+            await self._quit(smtp)
+        else:
+            self._idle.append((smtp, time.monotonic()))
+
+    async def _quit(self, smtp: aiosmtplib.SMTP) -> None:
+        """
+        The _quit function politely ends a session, dropping the connection if the server does not answer.
+
+        :param self: Represent the instance of the class
+        :param smtp: aiosmtplib.SMTP: The session to end
+        :return: None
+        :doc-author: Trelent
+        """
+        self._sent.pop(smtp, None)
+        if smtp.is_connected:
+            try:
+                await smtp.quit()
+            except aiosmtplib.SMTPException:
+                smtp.close()
+
+    def _discard(self, smtp: aiosmtplib.SMTP) -> None:
+        """
+        The _discard function drops the connection of a session that can not be reused.
+
+        :param self: Represent the instance of the class
+        :param smtp: aiosmtplib.SMTP: The session to drop
+        :return: None
+        :doc-author: Trelent
+        """
+        self._sent.pop(smtp, None)
+        smtp.close()
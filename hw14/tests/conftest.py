@@ -1,12 +1,20 @@
+import asyncio
+
+
+import datetime
 
 import pytest
 from fastapi.testclient import TestClient
+from fastapi_limiter import FastAPILimiter, default_identifier, http_default_callback
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 from main import app
 from src.database.models import Base
 from src.database.db import get_db
+from src.schemas import AuthUser
+from src.services.auth import auth_service
+from tests.fakes import FakeRedis, FakeSession
 
 
 SQLALCHEMY_DATABASE_URL = 'sqlite:///./test.db'
@@ -15,6 +23,14 @@ engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={'check_same_thread
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+@pytest.fixture(scope='module')
+def event_loop():
+    # One event loop per test module instead of a new one for every async test
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
 @pytest.fixture(scope='module')
 def session():
 
@@ -44,4 +60,29 @@ def client(session):
 
 @pytest.fixture(scope='module')
 def user():
-    return {'username': 'Mandalorian', 'email': 'mando@mail.com', 'password': '123456789'}
\ No newline at end of file
+    return {'username': 'Mandalorian', 'email': 'mando@mail.com', 'password': '123456789'}
+
+
+@pytest.fixture
+def current_user():
+    return AuthUser(id=1, username='leia', email='leia@mail.com', created_at=datetime.datetime(2023, 5, 1),
+                    avatar=None, confirmed=True)
+
+
+@pytest.fixture
+def fake_db():
+    return FakeSession()
+
+
+@pytest.fixture
+def fake_client(monkeypatch, fake_db, current_user):
+    """
+    A client for route tests that need neither the test database nor Redis:
+    requests get `fake_db` as their session and `current_user` as the signed-in user, and are never rate limited.
+    """
+    monkeypatch.setattr(FastAPILimiter, 'redis', FakeRedis())
+    monkeypatch.setattr(FastAPILimiter, 'identifier', default_identifier)
+    monkeypatch.setattr(FastAPILimiter, 'http_callback', http_default_callback)
+    monkeypatch.setitem(app.dependency_overrides, get_db, lambda: fake_db)
+    monkeypatch.setitem(app.dependency_overrides, auth_service.get_current_user, lambda: current_user)
+    return TestClient(app)
@@ -0,0 +1,135 @@
+from typing import Any, Protocol
+
+
+class RepoSession(Protocol):
+    """
+    The part of the SQLAlchemy Session the repository functions use; FakeSession has to provide all of it.
+    """
+
+    def execute(self, statement, params=None) -> Any: ...
+
+    def add(self, instance) -> None: ...
+
+    def commit(self) -> None: ...
+
+    def refresh(self, instance) -> None: ...
+
+    def expunge(self, instance) -> None: ...
+
+
+class FakeResult:
+    __slots__ = ('_value',)
+
+    def __init__(self, value):
+        self._value = value
+
+    def scalars(self):
+        return self
+
+    def all(self):
+        return self._value
+
+    def scalar_one(self):
+        return self._value
+
+    def scalar_one_or_none(self):
+        return self._value
+
+
+class FakeSession(RepoSession):
+    """
+    Stand-in for the SQLAlchemy Session used by the repository functions.
+    Every execute() returns `result`, whatever the statement; the statements and their parameters
+    are recorded in `executed` so tests can inspect them.
+    """
+
+    def __init__(self, result=None):
+        self.result = result
+        self.executed = []
+        self.added = []
+        self.rolled_back = False
+
+    def execute(self, statement, params=None):
+        self.executed.append((statement, params))
+        return FakeResult(self.result)
+
+    def add(self, instance):
+        self.added.append(instance)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self.rolled_back = True
+
+    def refresh(self, instance):
+        pass
+
+    def expunge(self, instance):
+        pass
+
+
+class FakeRedis:
+    """
+    In-memory stand-in for the async Redis client, with the get/set/delete calls the auth service makes.
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def evalsha(self, sha, numkeys, *args):
+        # The rate limiter's script; 0 means the request is within the limit
+        return 0
+
+
+class FakeSMTP:
+    """
+    Stand-in for a connected aiosmtplib.SMTP session, as far as SMTPPool and the email service use it.
+    The recipients of every send_message are recorded in `sent`; when `error` is set, the next send raises it instead.
+    """
+
+    def __init__(self):
+        self.is_connected = True
+        self.sent = []
+        self.error = None
+        self.quit_called = False
+        self.close_called = False
+
+    async def send_message(self, message, recipients=None):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+        self.sent.append(recipients)
+        return {}, 'OK'
+
+    async def quit(self):
+        self.quit_called = True
+        self.is_connected = False
+
+    def close(self):
+        self.close_called = True
+        self.is_connected = False
+
+
+class FakeConnect:
+    """
+    Connect callable for SMTPPool that opens a new FakeSMTP on every call and keeps them all in `sessions`.
+    """
+
+    def __init__(self):
+        self.sessions = []
+
+    async def __call__(self):
+        smtp = FakeSMTP()
+        self.sessions.append(smtp)
+        return smtp
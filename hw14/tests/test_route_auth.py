@@ -1,6 +1,8 @@
 from unittest.mock import MagicMock
 
 from src.database.models import User
+from src.services.auth import auth_service
+from tests.fakes import FakeRedis
 
 
 def test_create_user(client, user, monkeypatch):
@@ -66,4 +68,17 @@ def test_login_wrong_email(client, user):
     )
     assert response.status_code == 401, response.text
     data = response.json()
-    assert data['detail'] == 'Invalid email'
\ No newline at end of file
+    assert data['detail'] == 'Invalid email'
+
+def test_confirmed_email_clears_cached_user(fake_client, fake_db, monkeypatch):
+    email = 'leia@mail.com'
+    redis = FakeRedis()
+    redis.data[f'auth_user:{email}'] = b'{"confirmed": false}'
+    monkeypatch.setattr(auth_service, 'r', redis)
+    fake_db.result = User(id=2, username='leia', email=email, confirmed=False)
+
+    response = fake_client.get(f'/api/auth/confirmed_email/{auth_service.create_email_token({"sub": email})}')
+
+    assert response.status_code == 200, response.text
+    assert response.json()['message'] == 'Email confirmed'
+    assert f'auth_user:{email}' not in redis.data
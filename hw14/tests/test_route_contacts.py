@@ -0,0 +1,63 @@
+import datetime
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from src.database.models import Contact
+from src.routes import contacts as contacts_routes
+
+CONTACT = {
+    'first_name': 'John',
+    'last_name': 'Doe',
+    'email': 'johndoe@mail.com',
+    'phone': '+1234567890',
+    'date_of_birth': '1979-05-21',
+}
+
+
+@pytest.fixture
+def duplicate(monkeypatch):
+    async def violates_unique(*args, **kwargs):
+        raise IntegrityError('INSERT INTO contacts ...', {}, Exception('UNIQUE constraint failed: contacts.email'))
+
+    monkeypatch.setattr(contacts_routes.repository_contacts, 'create_contact', violates_unique)
+    monkeypatch.setattr(contacts_routes.repository_contacts, 'update_contact', violates_unique)
+
+
+@pytest.mark.parametrize('method, url', [('post', '/api/contacts/'), ('put', '/api/contacts/1')])
+def test_duplicate_contact_is_a_conflict(fake_client, fake_db, duplicate, method, url):
+    response = fake_client.request(method, url, json=CONTACT)
+    assert response.status_code == 409, response.text
+    assert response.json()['detail'] == 'Contact with this email or phone already exists'
+    assert fake_db.rolled_back
+
+
+CACHED_READS = ['/api/contacts/', '/api/contacts/birthdays', '/api/contacts/1']
+
+
+def stored_contact():
+    return Contact(id=1, **{**CONTACT, 'date_of_birth': datetime.date(1979, 5, 21)}, user_id=1,
+                   created_at=datetime.datetime(2023, 5, 1), updated_at=datetime.datetime(2023, 5, 1))
+
+
+@pytest.mark.parametrize('url', CACHED_READS)
+def test_contact_reads_are_privately_cacheable(fake_client, fake_db, url):
+    contact = stored_contact()
+    fake_db.result = contact if url.endswith('/1') else [contact]
+
+    response = fake_client.get(url)
+
+    assert response.status_code == 200, response.text
+    assert response.headers['Cache-Control'] == 'private, max-age=30'
+    assert response.headers['Vary'] == 'Authorization'
+
+
+@pytest.mark.parametrize('url', CACHED_READS)
+def test_contact_not_found_is_not_cacheable(fake_client, fake_db, url):
+    fake_db.result = None if url.endswith('/1') else []
+
+    response = fake_client.get(url)
+
+    assert response.status_code == 404, response.text
+    assert 'Cache-Control' not in response.headers
+    assert 'Vary' not in response.headers
@@ -0,0 +1,22 @@
+import datetime
+
+from src.database.models import User
+from src.routes import users as users_routes
+from src.services.auth import auth_service
+from tests.fakes import FakeRedis
+
+
+def test_update_avatar_clears_cached_user(fake_client, fake_db, current_user, monkeypatch):
+    redis = FakeRedis()
+    redis.data[f'auth_user:{current_user.email}'] = current_user.json()
+    monkeypatch.setattr(auth_service, 'r', redis)
+    monkeypatch.setattr(users_routes.cloudinary.uploader, 'upload', lambda file, **kwargs: {'version': 1})
+    avatar = 'https://res.cloudinary.com/name/image/upload/c_fill,h_250,w_250/v1/ContactsApp/leia'
+    fake_db.result = User(id=current_user.id, username=current_user.username, email=current_user.email,
+                          created_at=datetime.datetime(2023, 5, 1), avatar=avatar)
+
+    response = fake_client.patch('/api/users/avatar', files={'file': ('avatar.png', b'png', 'image/png')})
+
+    assert response.status_code == 200, response.text
+    assert response.json()['avatar'] == avatar
+    assert f'auth_user:{current_user.email}' not in redis.data
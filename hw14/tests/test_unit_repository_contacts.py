@@ -1,9 +1,8 @@
 import datetime
-import unittest
-from unittest.mock import MagicMock
 from datetime import date
 
-from sqlalchemy.orm import Session
+import pytest
+from sqlalchemy.dialects import postgresql
 
 from src.database.models import Contact, User
 from src.schemas import ContactModel
@@ -15,113 +14,159 @@ from src.repository.contacts import (
     update_contact,
     remove_contact,
 )
+from src.repository import contacts as repository_contacts
+from tests.fakes import FakeSession
 
+pytestmark = pytest.mark.asyncio
 
-class TestContacts(unittest.IsolatedAsyncioTestCase):
-
-    def setUp(self):
-        self.session = MagicMock(spec=Session)
-        self.user = User(id=1)
-        self.contact_test = Contact(
-            id=1,
-            first_name='John',
-            last_name='Doe',
-            email='johndoe@mail.com',
-            phone='+1234567890',
-            date_of_birth=datetime.date(year=1979, month=5, day=21),
-        )
-
-    async def test_get_contacts(self):
-        contacts = [self.contact_test, Contact(), Contact()]
-        self.session.query().filter().offset().limit().all.return_value = contacts
-        result = await get_contacts(skip=0, limit=10, first_name='', last_name='', email='', user=self.user, db=self.session)
-        self.assertEqual(result, contacts)
-
-    async def test_get_contacts_filter_by_first_name(self):
-        contacts = [self.contact_test, Contact(), Contact()]
-        self.session.query().filter().all.return_value = contacts
-        result = await get_contacts(skip=0, limit=10, first_name=self.contact_test.first_name, last_name='', email='', user=self.user, db=self.session)
-        self.assertEqual(result, contacts)
-
-    async def test_get_contacts_filter_by_last_name(self):
-        contacts = [self.contact_test, Contact(), Contact()]
-        self.session.query().filter().all.return_value = contacts
-        result = await get_contacts(skip=0, limit=10, first_name='', last_name=self.contact_test.last_name, email='', user=self.user, db=self.session)
-        self.assertEqual(result, contacts)
-
-    async def test_get_contacts_filter_by_email(self):
-        contacts = [self.contact_test, Contact(), Contact()]
-        self.session.query().filter().all.return_value = contacts
-        result = await get_contacts(skip=0, limit=10, first_name='', last_name='', email=self.contact_test.email, user=self.user, db=self.session)
-        self.assertEqual(result, contacts)
-
-    async def test_get_contact_by_id(self):
-        contacts = [self.contact_test, Contact(), Contact()]
-        self.session.query().filter().first.return_value = contacts
-        result = await get_contact_by_id(contact_id=self.contact_test.id, user=self.user, db=self.session)
-        self.assertEqual(result, contacts)
-
-    async def test_create_contact(self):
-        body = ContactModel(
-            first_name=self.contact_test.first_name,
-            last_name=self.contact_test.last_name,
-            email=self.contact_test.email,
-            phone=self.contact_test.email,
-            date_of_birth=self.contact_test.date_of_birth,
-        )
-        result = await create_contact(body=body, db=self.session, user=self.user)
-        self.assertEqual(result.first_name, body.first_name)
-        self.assertEqual(result.last_name, body.last_name)
-        self.assertEqual(result.email, body.email)
-        self.assertEqual(result.phone, body.phone)
-        self.assertEqual(result.date_of_birth, body.date_of_birth)
-        self.assertTrue(hasattr(result, "id"))
-
-    async def test_remove_contact(self):
-        contact = self.contact_test
-        self.session.query().filter().first.return_value = contact
-        result = await remove_contact(contact_id=self.contact_test.id, db=self.session, user=self.user)
-        self.assertEqual(result, contact)
-
-    async def test_remove_contact_not_found(self):
-        self.session.query().filter().first.return_value = None
-        result = await remove_contact(contact_id=self.contact_test.id, db=self.session, user=self.user)
-        self.assertIsNone(result)
-
-    async def test_update_contact(self):
-        contact = self.contact_test
-        body = ContactModel(
-            first_name='Jonny',
-            last_name=self.contact_test.last_name,
-            email=self.contact_test.email,
-            phone=self.contact_test.email,
-            date_of_birth=self.contact_test.date_of_birth)
-        self.session.query().filter().first.return_value = contact
-        result = await update_contact(contact_id=self.contact_test.id, body=body, db=self.session, user=self.user)
-        self.assertEqual(result, contact)
-
-    async def test_update_contact_not_found(self):
-        body = ContactModel(
-            first_name='Jonny',
-            last_name=self.contact_test.last_name,
-            email=self.contact_test.email,
-            phone=self.contact_test.email,
-            date_of_birth=self.contact_test.date_of_birth)
-        self.session.query().filter().first.return_value = None
-        result = await update_contact(contact_id=self.contact_test.id, body=body, db=self.session, user=self.user)
-        self.assertIsNone(result)
-
-    async def test_get_contacts_birthdays(self):
-        today = date.today()
-        contacts = [
-            Contact(id=1, first_name='John', last_name='Doe', email='john@example.com', date_of_birth=today),
-            Contact(id=2, first_name='Jane', last_name='Smith', email='jane@example.com', date_of_birth=today),
-        ]
-        self.session.query().filter().offset().limit().all.return_value = contacts
-
-        result = await get_contacts_birthdays(0, 10, self.user, self.session)
-        self.assertEqual(result, contacts)
-
-
-if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+
+@pytest.fixture
+def db():
+    return FakeSession()
+
+
+# The user and the contacts are only read by the tests, so they are built once per module
+@pytest.fixture(scope='module')
+def current_user():
+    return User(id=1)
+
+
+@pytest.fixture(scope='module')
+def contact():
+    return Contact(
+        id=1,
+        first_name='John',
+        last_name='Doe',
+        email='johndoe@mail.com',
+        phone='+1234567890',
+        date_of_birth=datetime.date(year=1979, month=5, day=21),
+    )
+
+
+@pytest.fixture(scope='module')
+def contacts(contact):
+    return (contact, Contact(), Contact())
+
+
+async def test_get_contacts(db, current_user, contacts):
+    db.result = contacts
+    result = await get_contacts(skip=0, limit=10, first_name='', last_name='', email='', user=current_user, db=db)
+    assert result == contacts
+
+
+@pytest.mark.parametrize('field', ['first_name', 'last_name', 'email'])
+async def test_get_contacts_filter_by(db, current_user, contact, contacts, field):
+    db.result = contacts
+    filters = {'first_name': '', 'last_name': '', 'email': '', field: getattr(contact, field)}
+    result = await get_contacts(skip=0, limit=10, **filters, user=current_user, db=db)
+    assert result == contacts
+    assert db.executed[-1][1][field] == getattr(contact, field)
+
+
+async def test_get_contacts_after_id(db, current_user, contacts):
+    db.result = contacts
+    result = await get_contacts(skip=0, limit=10, first_name='', last_name='', email='', user=current_user, db=db, after_id=5)
+    assert result == contacts
+    params = db.executed[-1][1]
+    assert params['after_id'] == 5
+    assert 'skip' not in params
+
+
+async def test_get_contact_by_id(db, current_user, contact):
+    db.result = contact
+    result = await get_contact_by_id(contact_id=contact.id, user=current_user, db=db)
+    assert result == contact
+
+
+async def test_create_contact(db, current_user, contact):
+    body = ContactModel(
+        first_name=contact.first_name,
+        last_name=contact.last_name,
+        email=contact.email,
+        phone=contact.email,
+        date_of_birth=contact.date_of_birth,
+    )
+    db.result = Contact(id=1, **body.dict(), user_id=current_user.id)
+    result = await create_contact(body=body, db=db, user=current_user)
+    assert result.first_name == body.first_name
+    assert result.last_name == body.last_name
+    assert result.email == body.email
+    assert result.phone == body.phone
+    assert result.date_of_birth == body.date_of_birth
+    assert hasattr(result, "id")
+
+
+async def test_remove_contact(db, current_user, contact):
+    db.result = contact
+    result = await remove_contact(contact_id=contact.id, db=db, user=current_user)
+    assert result == contact
+
+
+async def test_remove_contact_not_found(db, current_user, contact):
+    db.result = None
+    result = await remove_contact(contact_id=contact.id, db=db, user=current_user)
+    assert result is None
+
+
+async def test_update_contact(db, current_user, contact):
+    body = ContactModel(
+        first_name='Jonny',
+        last_name=contact.last_name,
+        email=contact.email,
+        phone=contact.email,
+        date_of_birth=contact.date_of_birth)
+    db.result = contact
+    result = await update_contact(contact_id=contact.id, body=body, db=db, user=current_user)
+    assert result == contact
+
+
+async def test_update_contact_not_found(db, current_user, contact):
+    body = ContactModel(
+        first_name='Jonny',
+        last_name=contact.last_name,
+        email=contact.email,
+        phone=contact.email,
+        date_of_birth=contact.date_of_birth)
+    db.result = None
+    result = await update_contact(contact_id=contact.id, body=body, db=db, user=current_user)
+    assert result is None
+
+
+async def test_get_contacts_birthdays(db, current_user):
+    today = date.today()
+    contacts = [
+        Contact(id=1, first_name='John', last_name='Doe', email='john@example.com', date_of_birth=today),
+        Contact(id=2, first_name='Jane', last_name='Smith', email='jane@example.com', date_of_birth=today),
+    ]
+    db.result = contacts
+
+    result = await get_contacts_birthdays(0, 10, current_user, db)
+    assert result == contacts
+
+
+def pin_today(monkeypatch, today: date):
+    class PinnedDate(date):
+        @classmethod
+        def today(cls):
+            return today
+
+    monkeypatch.setattr(repository_contacts, 'date', PinnedDate)
+
+
+BIRTHDAY = 'to_char(contacts.date_of_birth, %(to_char_1)s)'
+
+
+@pytest.mark.parametrize('today, window, bounds', [
+    (date(2023, 6, 10), f'{BIRTHDAY} BETWEEN %(to_char_2)s AND %(to_char_3)s', ('06-10', '06-17')),
+    # The window wraps over the new year, so it is split in two halves joined with OR
+    (date(2023, 12, 28), f'({BIRTHDAY} >= %(to_char_2)s OR {BIRTHDAY} <= %(to_char_3)s)', ('12-28', '01-04')),
+])
+async def test_get_contacts_birthdays_window(db, current_user, monkeypatch, today, window, bounds):
+    pin_today(monkeypatch, today)
+    await get_contacts_birthdays(5, 10, current_user, db)
+
+    compiled = db.executed[-1][0].compile(dialect=postgresql.dialect())
+    assert f'WHERE contacts.user_id = %(user_id_1)s AND {window} ORDER BY contacts.id' in str(compiled)
+    assert (compiled.params['to_char_2'], compiled.params['to_char_3']) == bounds
+    assert compiled.params['to_char_1'] == 'MM-DD'
+    assert compiled.params['user_id_1'] == current_user.id
@@ -0,0 +1,164 @@
+import asyncio
+import datetime
+import time
+
+import pytest
+from cachetools import TLRUCache
+from fastapi import HTTPException
+
+from src.database.models import User
+from src.schemas import AuthUser
+from src.services import auth as auth_module
+from src.services.auth import auth_service
+from tests.fakes import FakeRedis, FakeSession
+
+pytestmark = pytest.mark.asyncio
+
+EMAIL = 'leia@mail.com'
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    """
+    Replaces the database lookup of get_current_user with one that blocks until `release` is set,
+    and counts in `calls` how many times it was started.
+    """
+    state = {'calls': 0, 'release': asyncio.Event()}
+
+    async def get_user_by_email(email, db):
+        state['calls'] += 1
+        await state['release'].wait()
+        return User(id=1, username='leia', email=email, created_at=datetime.datetime(2023, 5, 1), confirmed=True)
+
+    monkeypatch.setattr(auth_module.repository_users, 'get_user_by_email', get_user_by_email)
+    monkeypatch.setattr(auth_service, 'r', FakeRedis())
+    monkeypatch.setattr(auth_service, '_inflight', {})
+    return state
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Gives get_current_user an empty token cache that runs on `clock['now']` instead of the wall clock,
+    and counts the calls of jwt.decode in `clock['decoded']`.
+    """
+    state = {'now': time.time(), 'decoded': 0}
+    decode = auth_module.jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        state['decoded'] += 1
+        return decode(*args, **kwargs)
+
+    cache = TLRUCache(maxsize=16, ttu=auth_service.token_cache.ttu, timer=lambda: state['now'])
+    monkeypatch.setattr(auth_service, 'token_cache', cache)
+    monkeypatch.setattr(auth_module.jwt, 'decode', counting_decode)
+    return state
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def current_user_task():
+    token = await auth_service.create_access_token({'sub': EMAIL})
+    return asyncio.create_task(auth_service.get_current_user(token=token, db=FakeSession()))
+
+
+async def test_cancelled_waiter_does_not_cancel_the_lookup(lookups):
+    leader = await current_user_task()
+    await settle()
+    cancelled, waiter = await current_user_task(), await current_user_task()
+    await settle()
+
+    cancelled.cancel()
+    await settle()
+    lookups['release'].set()
+
+    assert (await asyncio.wait_for(leader, 1)).email == EMAIL
+    assert (await asyncio.wait_for(waiter, 1)).email == EMAIL
+    assert cancelled.cancelled()
+    assert lookups['calls'] == 1
+
+
+async def test_waiters_take_over_when_the_lookup_is_cancelled(lookups):
+    leader = await current_user_task()
+    await settle()
+    waiters = [await current_user_task(), await current_user_task()]
+    await settle()
+
+    leader.cancel()
+    await settle()
+    lookups['release'].set()
+
+    for waiter in waiters:
+        assert (await asyncio.wait_for(waiter, 1)).email == EMAIL
+    assert leader.cancelled()
+    # One waiter restarted the lookup, the other one waited for it
+    assert lookups['calls'] == 2
+    assert auth_service._inflight == {}
+
+
+async def test_cached_user_is_served_from_redis(lookups):
+    cached = AuthUser(id=1, username='leia', email=EMAIL, created_at=datetime.datetime(2023, 5, 1), avatar=None, confirmed=True)
+    await auth_service.r.set(f'auth_user:{EMAIL}', cached.json())
+    # What an older version pickled under the old key must not be read
+    await auth_service.r.set(f'user:{EMAIL}', b'\x80\x04not json')
+
+    user = await asyncio.wait_for(await current_user_task(), 1)
+
+    assert user == cached
+    assert lookups['calls'] == 0
+
+
+async def test_loaded_user_is_cached_as_json(lookups):
+    lookups['release'].set()
+
+    user = await asyncio.wait_for(await current_user_task(), 1)
+
+    assert AuthUser.parse_raw(await auth_service.r.get(f'auth_user:{EMAIL}')) == user
+
+
+async def current_user(token):
+    return await asyncio.wait_for(auth_service.get_current_user(token=token, db=FakeSession()), 1)
+
+
+async def test_repeated_token_is_decoded_once(lookups, clock):
+    lookups['release'].set()
+    token = await auth_service.create_access_token({'sub': EMAIL})
+
+    for _ in range(3):
+        assert (await current_user(token)).email == EMAIL
+
+    assert clock['decoded'] == 1
+
+
+@pytest.mark.parametrize('expires_in, cached_for', [(30, 30), (15 * 60, 60)])
+async def test_cached_token_expires_with_the_token(lookups, clock, expires_in, cached_for):
+    lookups['release'].set()
+    token = await auth_service.create_access_token({'sub': EMAIL}, expires_delta=expires_in)
+    issued = clock['now']
+    await current_user(token)
+
+    # Tokens are issued on whole seconds, so the entry may expire up to a second early
+    clock['now'] = issued + cached_for - 1.5
+    await current_user(token)
+    assert clock['decoded'] == 1
+
+    clock['now'] = issued + cached_for + 0.5
+    await current_user(token)
+    assert clock['decoded'] == 2
+
+
+async def test_rejected_tokens_are_not_cached(lookups, clock):
+    refresh_token = await auth_service.create_refresh_token({'sub': EMAIL})
+    expired_token = await auth_service.create_access_token({'sub': EMAIL}, expires_delta=-10)
+
+    for token in (refresh_token, expired_token, 'not.a.token', refresh_token):
+        with pytest.raises(HTTPException) as error:
+            await current_user(token)
+        assert error.value.status_code == 401
+
+    assert len(auth_service.token_cache) == 0
+    assert clock['decoded'] == 4
+    assert lookups['calls'] == 0
@@ -0,0 +1,80 @@
+import asyncio
+import email as email_parser
+from unittest.mock import AsyncMock
+
+import pytest
+from starlette.datastructures import URL
+
+from src.services import email as email_service
+from src.services.smtp_pool import SMTPPool
+from tests.fakes import FakeConnect
+
+pytestmark = pytest.mark.asyncio
+
+USERNAME = '<b>Ann & "co"</b>'
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    send = AsyncMock()
+    monkeypatch.setattr(email_service, '_send', send)
+    monkeypatch.setattr(email_service, '_mail_queue', None)
+    return send
+
+
+def html_body(message) -> str:
+    parsed = email_parser.message_from_bytes(message.as_bytes())
+    return parsed.get_payload()[0].get_payload(decode=True).decode()
+
+
+@pytest.mark.parametrize('username', ['mando', USERNAME, '__TOKEN__', '__USERNAME__'])
+async def test_render_confirmation_matches_template(username):
+    host = URL('http://localhost:8000/')
+    result = await email_service._render_confirmation(host, username, 'header.payload.signature')
+    expected = await email_service._template.render_async(host=str(host), username=username, token='header.payload.signature')
+    assert result == expected
+
+
+async def test_send_email_with_request_url(sent):
+    await email_service.send_email('ann@example.com', USERNAME, URL('http://localhost:8000/'))
+
+    sent.assert_awaited_once()
+    message = sent.await_args.args[0]
+    body = html_body(message)
+    token = email_service._token_for.__wrapped__('ann@example.com', email_service.datetime.now(email_service.timezone.utc).date())
+    assert message['To'] == 'ann@example.com'
+    assert 'Hi &lt;b&gt;Ann &amp; &#34;co&#34;&lt;/b&gt;,' in body
+    assert f'href="http://localhost:8000/api/auth/confirmed_email/{token}"' in body
+
+
+async def test_stop_mail_workers_gives_up_after_timeout(monkeypatch, caplog):
+    async def never_delivered(email, username, host):
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(email_service, '_deliver', never_delivered)
+    await email_service.start_mail_workers(count=2)
+    for i in range(5):
+        await email_service.send_email(f'user{i}@example.com', 'user', 'http://localhost:8000/')
+
+    await asyncio.wait_for(email_service.stop_mail_workers(timeout=0.05), 1)
+
+    assert 'dropping 5 emails' in caplog.text
+    assert email_service._mail_queue is None
+    assert email_service._workers == []
+    assert email_service._sending == 0
+
+
+async def test_send_email_bulk_sends_one_message_per_chunk(monkeypatch):
+    connect = FakeConnect()
+    monkeypatch.setattr(email_service, 'smtp_pool', SMTPPool(connect, max_messages=2))
+    emails = [f'user{i}@example.com' for i in range(120)]
+
+    accepted = await email_service.send_email_bulk(emails, 'News', 'email_template.html',
+                                                   {'host': 'http://localhost:8000/', 'username': 'all', 'token': ''})
+
+    assert accepted == 120
+    sent = [chunk for smtp in connect.sessions for chunk in smtp.sent]
+    assert [len(chunk) for chunk in sent] == [50, 50, 20]
+    assert [email for chunk in sent for email in chunk] == emails
+    # Every chunk counts towards max_messages, so the third one needed a new session
+    assert len(connect.sessions) == 2
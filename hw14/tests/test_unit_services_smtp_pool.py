@@ -0,0 +1,123 @@
+import asyncio
+
+import aiosmtplib
+import pytest
+
+from src.services.smtp_pool import SMTPPool
+from tests.fakes import FakeConnect
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+def connect():
+    return FakeConnect()
+
+
+async def test_connects_lazily_and_reuses_the_session(connect):
+    pool = SMTPPool(connect)
+    assert connect.sessions == []
+
+    for _ in range(3):
+        async with pool.acquire() as smtp:
+            await smtp.send_message('message')
+
+    assert len(connect.sessions) == 1
+    assert connect.sessions[0].sent == [None, None, None]
+
+
+async def test_session_is_replaced_after_max_messages(connect):
+    pool = SMTPPool(connect, max_messages=2)
+
+    for _ in range(5):
+        async with pool.acquire() as smtp:
+            await smtp.send_message('message')
+
+    assert [len(smtp.sent) for smtp in connect.sessions] == [2, 2, 1]
+    assert [smtp.quit_called for smtp in connect.sessions] == [True, True, False]
+
+
+async def test_idle_session_is_discarded_after_max_idle(connect):
+    pool = SMTPPool(connect, max_idle=0)
+
+    for _ in range(2):
+        async with pool.acquire():
+            pass
+
+    assert len(connect.sessions) == 2
+    assert connect.sessions[0].close_called
+
+
+async def test_dropped_session_is_discarded(connect):
+    pool = SMTPPool(connect)
+    async with pool.acquire() as smtp:
+        pass
+    # The server closed the connection while the session sat in the pool
+    smtp.is_connected = False
+
+    async with pool.acquire() as other:
+        pass
+
+    assert other is not smtp
+    assert smtp.close_called
+
+
+async def test_refused_message_keeps_the_session(connect):
+    pool = SMTPPool(connect)
+
+    with pytest.raises(aiosmtplib.SMTPRecipientsRefused):
+        async with pool.acquire() as smtp:
+            smtp.error = aiosmtplib.SMTPRecipientsRefused([])
+            await smtp.send_message('message')
+    async with pool.acquire() as other:
+        pass
+
+    assert other is smtp
+    assert not smtp.close_called
+
+
+async def test_broken_session_is_discarded(connect):
+    pool = SMTPPool(connect)
+
+    with pytest.raises(aiosmtplib.SMTPServerDisconnected):
+        async with pool.acquire() as smtp:
+            smtp.error = aiosmtplib.SMTPServerDisconnected('gone')
+            await smtp.send_message('message')
+    async with pool.acquire() as other:
+        pass
+
+    assert other is not smtp
+    assert smtp.close_called
+    assert len(connect.sessions) == 2
+
+
+async def test_at_most_max_size_sessions_are_in_use(connect):
+    pool = SMTPPool(connect, max_size=2)
+    release = asyncio.Event()
+    in_use = []
+
+    async def hold():
+        async with pool.acquire() as smtp:
+            in_use.append(smtp)
+            await release.wait()
+
+    holders = [asyncio.create_task(hold()) for _ in range(3)]
+    for _ in range(5):
+        await asyncio.sleep(0)
+    assert len(in_use) == 2
+
+    release.set()
+    await asyncio.wait_for(asyncio.gather(*holders), 1)
+    assert len(in_use) == 3
+    # The third holder got a session the first two returned
+    assert len(connect.sessions) == 2
+
+
+async def test_close_quits_idle_sessions(connect):
+    pool = SMTPPool(connect)
+    async with pool.acquire():
+        pass
+
+    await pool.close()
+
+    assert connect.sessions[0].quit_called